@@ -1,13 +1,21 @@
 import os
 import hmac
-import hashlib
 import json
 import logging
+import sqlite3
+import ssl
+import threading
+import orjson
+import simdjson
+import zstandard
 from datetime import datetime
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Column, Integer, String, DateTime, Text, UniqueConstraint
+from sqlalchemy import event, Column, Integer, String, DateTime, Index, LargeBinary, UniqueConstraint
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import load_only
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -15,13 +23,72 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+def uses_queue_pool(database_uri: str) -> bool:
+    """
+    Check whether the engine will get a sized QueuePool
+    In-memory SQLite gets a StaticPool or SingletonThreadPool, which reject pool sizing
+    """
+    url = make_url(database_uri)
+    in_memory_sqlite = url.drivername.startswith('sqlite') and url.database in (None, '', ':memory:')
+    return not in_memory_sqlite
+
 # Configuration
 app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///webhooks.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_pre_ping': True,
+}
+
+if uses_queue_pool(app.config['SQLALCHEMY_DATABASE_URI']):
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'].update(pool_size=20, max_overflow=10)
+
 app.config['WEBHOOK_SECRET'] = os.environ.get('WEBHOOK_SECRET', 'test_secret')
 
+# Encoded once so the webhook hot path skips the config lookup and encode
+WEBHOOK_SECRET_BYTES = app.config['WEBHOOK_SECRET'].encode('utf-8')
+
+# SQLite tuning: WAL lets readers run alongside the writer, and NORMAL
+# sync only fsyncs at checkpoints instead of on every commit
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA mmap_size=268435456',
+)
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Apply SQLite pragmas to each new connection
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
 db = SQLAlchemy(app)
 
+# HMAC-SHA256 runs through OpenSSL (via hashlib), which picks SHA-NI/ARMv8 SHA
+# instructions at runtime when the CPU has them
+logger.info(f"HMAC-SHA256 backed by {ssl.OPENSSL_VERSION}")
+
+# Hex-encoded SHA-256 digest length
+SIGNATURE_HEX_LENGTH = 64
+
+# Bytes read from the request stream per HMAC update
+BODY_CHUNK_SIZE = 65536
+
+# simdjson parsers are reusable but not thread-safe, so keep one per thread
+_json_parsers = threading.local()
+SIMDJSON_PARSER_IN_USE = 'Tried to re-use a parser'
+
+# zstd contexts have the same restriction
+_zstd_contexts = threading.local()
+ZSTD_LEVEL = 3
+ZSTD_FRAME_MAGIC = b'\x28\xb5\x2f\xfd'
+
 # Database Model
 class PaymentEvent(db.Model):
     __tablename__ = 'payment_events'
@@ -30,39 +97,142 @@ class PaymentEvent(db.Model):
     event_id = Column(String(100), unique=True, nullable=False)
     payment_id = Column(String(100), nullable=False)
     event_type = Column(String(50), nullable=False)
-    raw_payload = Column(Text, nullable=False)
+    raw_payload = Column(LargeBinary, nullable=False)
     received_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     
-    # Ensure unique event_id for idempotency
+    # Ensure unique event_id for idempotency; the composite index serves
+    # per-payment lookups already ordered by received_at
     __table_args__ = (
         UniqueConstraint('event_id', name='unique_event_id'),
+        Index('ix_payment_events_payment_received', 'payment_id', 'received_at'),
     )
     
+    def get_raw_payload(self) -> bytes:
+        """
+        Return the stored payload as the original JSON bytes
+        """
+        return decompress_payload(self.raw_payload)
+
     def to_dict(self):
         return {
             'event_type': self.event_type,
             'received_at': self.received_at.isoformat() + 'Z'
         }
 
+# Insert statements are built once; SQLAlchemy caches their compiled form.
+# Dialects that support INSERT ... ON CONFLICT DO NOTHING ... RETURNING get
+# an upsert that skips duplicate event_ids
+INSERT_STMT = PaymentEvent.__table__.insert()
+UPSERT_STMTS = {
+    name: dialect_insert(PaymentEvent.__table__)
+              .on_conflict_do_nothing(index_elements=['event_id'])
+              .returning(PaymentEvent.event_id)
+    for name, dialect_insert in (('sqlite', sqlite.insert), ('postgresql', postgresql.insert))
+}
+
 # Utility Functions
-def verify_signature(payload_body: bytes, signature: str, secret: str) -> bool:
+def decode_signature(signature: str):
     """
-    Verify webhook signature using HMAC-SHA256
+    Decode a hex HMAC-SHA256 signature
+    Returns: 32-byte digest, or None if the signature is malformed
     """
+    # Depends only on the supplied signature, never on the secret
+    if len(signature) != SIGNATURE_HEX_LENGTH:
+        return None
     try:
-        expected_signature = hmac.new(
-            secret.encode('utf-8'),
-            payload_body,
-            hashlib.sha256
-        ).hexdigest()
-        
-        # Compare signatures securely to prevent timing attacks
-        return hmac.compare_digest(signature, expected_signature)
-    except Exception as e:
-        logger.error(f"Signature verification error: {e}")
+        return bytes.fromhex(signature)
+    except ValueError:
+        return None
+
+def read_body(stream, mac=None) -> bytes:
+    """
+    Read the request body in chunks, feeding each chunk to the HMAC as it
+    arrives so hashing overlaps with receiving
+    """
+    chunks = []
+    while True:
+        chunk = stream.read(BODY_CHUNK_SIZE)
+        if not chunk:
+            break
+        if mac is not None:
+            mac.update(chunk)
+        chunks.append(chunk)
+    return b''.join(chunks)
+
+def verify_signature(mac, signature_digest) -> bool:
+    """
+    Verify webhook signature against the HMAC-SHA256 of the body
+    """
+    if mac is None or signature_digest is None:
         return False
 
-def parse_razorpay_payload(payload: dict) -> tuple:
+    # Compare raw digests securely to prevent timing attacks
+    return hmac.compare_digest(signature_digest, mac.digest())
+
+def compress_payload(data: bytes) -> bytes:
+    """
+    Compress a payload for storage with the calling thread's zstd compressor
+    """
+    compressor = getattr(_zstd_contexts, 'compressor', None)
+    if compressor is None:
+        compressor = _zstd_contexts.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    return compressor.compress(data)
+
+def decompress_payload(data: bytes) -> bytes:
+    """
+    Decompress a stored payload with the calling thread's zstd decompressor
+    Rows written before compression hold plain JSON and are returned as-is
+    """
+    if isinstance(data, str):
+        return data.encode('utf-8')
+    if not data.startswith(ZSTD_FRAME_MAGIC):
+        return data
+
+    decompressor = getattr(_zstd_contexts, 'decompressor', None)
+    if decompressor is None:
+        decompressor = _zstd_contexts.decompressor = zstandard.ZstdDecompressor()
+    return decompressor.decompress(data)
+
+def parse_json(raw: bytes):
+    """
+    Parse JSON on demand with the calling thread's simdjson parser
+    Values are only decoded when accessed
+    """
+    parser = getattr(_json_parsers, 'parser', None)
+    if parser is None:
+        parser = _json_parsers.parser = simdjson.Parser()
+    try:
+        return parser.parse(raw)
+    except RuntimeError as e:
+        if SIMDJSON_PARSER_IN_USE not in str(e):
+            # Valid JSON simdjson can't represent, e.g. integers wider
+            # than 64 bits; the stdlib parser handles it or raises ValueError
+            try:
+                return json.loads(raw)
+            except RecursionError:
+                # Nested deeper than either parser allows (simdjson DEPTH_ERROR)
+                raise ValueError("JSON document is nested too deeply")
+
+    # A document from the previous parse is still referenced
+    _json_parsers.parser = simdjson.Parser()
+    return parse_json(raw)
+
+def minify_event(event) -> bytes:
+    """
+    Compact JSON bytes for one event of a batch
+    """
+    if isinstance(event, simdjson.Object):
+        return event.mini
+    # Stdlib-parsed documents may hold integers orjson can't encode
+    return json.dumps(event, separators=(',', ':')).encode('utf-8')
+
+def is_valid_id(value) -> bool:
+    """
+    Check that an id is a JSON string or integer, the only types stored
+    """
+    return isinstance(value, (str, int)) and not isinstance(value, bool)
+
+def parse_razorpay_payload(payload) -> tuple:
     """
     Parse Razorpay webhook payload to extract required fields
     Returns: (event_type, event_id, payment_id)
@@ -74,12 +244,107 @@ def parse_razorpay_payload(payload: dict) -> tuple:
         
         if not all([event_type, event_id, payment_id]):
             raise ValueError("Missing required fields in payload")
+        if not isinstance(event_type, str):
+            raise ValueError("Event type must be a string")
+        if not is_valid_id(event_id):
+            raise ValueError("Event id must be a string or integer")
+        if not is_valid_id(payment_id):
+            raise ValueError("Payment id must be a string or integer")
             
         return event_type, event_id, payment_id
     except Exception as e:
         logger.error(f"Payload parsing error: {e}")
         raise ValueError(f"Invalid payload structure: {e}")
 
+def build_event_rows(events, raw_payload: bytes, is_batch: bool, received_at: datetime) -> tuple:
+    """
+    Parse and validate every event before any database work
+    Returns: (rows to insert, result dict per row, all results in request order)
+    Row results get their status once the rows are stored
+    """
+    rows = []
+    row_results = []
+    results = []
+    for event in events:
+        try:
+            event_type, event_id, payment_id = parse_razorpay_payload(event)
+        except ValueError as e:
+            event_id = event.get('id') if isinstance(event, (dict, simdjson.Object)) else None
+            if not is_valid_id(event_id):
+                event_id = None
+            logger.error(f"Payload parsing failed for event {event_id}: {e}")
+            results.append({'event_id': event_id, 'status': 'failed', 'error': str(e)})
+            continue
+
+        # A single event is stored exactly as received; batch items
+        # are minified from the parsed document
+        event_bytes = minify_event(event) if is_batch else raw_payload
+
+        # Ids are stored in String columns, and RETURNING hands them back as
+        # str, so rows must carry str ids even when the JSON had integers
+        rows.append({
+            'event_id': str(event_id),
+            'payment_id': str(payment_id),
+            'event_type': event_type,
+            'raw_payload': compress_payload(event_bytes),
+            'received_at': received_at
+        })
+        result = {'event_id': event_id}
+        row_results.append(result)
+        results.append(result)
+
+    return rows, row_results, results
+
+def store_events(rows: list) -> list:
+    """
+    Insert event rows in a single statement, skipping duplicate event_ids
+    Returns: list of 'success' / 'duplicate' statuses, one per row
+    """
+    if not rows:
+        return []
+
+    upsert_stmt = UPSERT_STMTS.get(db.engine.dialect.name)
+    if upsert_stmt is None:
+        return store_events_with_retry(rows)
+
+    inserted = set(db.session.execute(upsert_stmt, rows).scalars())
+    db.session.commit()
+
+    # Only the first occurrence of an inserted event_id counts as new
+    statuses = []
+    for row in rows:
+        if row['event_id'] in inserted:
+            inserted.discard(row['event_id'])
+            statuses.append('success')
+        else:
+            statuses.append('duplicate')
+    return statuses
+
+def store_events_with_retry(rows: list) -> list:
+    """
+    Insert event rows with a single executemany and commit
+    Falls back to per-row inserts if the batch hits a duplicate event_id
+    Returns: list of 'success' / 'duplicate' statuses, one per row
+    """
+    try:
+        db.session.execute(INSERT_STMT, rows)
+        db.session.commit()
+        return ['success'] * len(rows)
+    except IntegrityError:
+        db.session.rollback()
+
+    # Retry one row at a time to find out which events collided
+    statuses = []
+    for row in rows:
+        try:
+            db.session.execute(INSERT_STMT, row)
+            db.session.commit()
+            statuses.append('success')
+        except IntegrityError:
+            db.session.rollback()
+            statuses.append('duplicate')
+    return statuses
+
 # Routes
 @app.route('/webhook/payments', methods=['POST'])
 def webhook_payments():
@@ -87,57 +352,47 @@ def webhook_payments():
     Webhook endpoint to receive payment status updates
     """
     try:
-        # Get raw payload for signature verification
-        raw_payload = request.get_data()
+        # Hash the body while reading it, unless the signature is malformed
+        # and could never match
+        signature = request.headers.get('X-Razorpay-Signature')
+        signature_digest = decode_signature(signature) if signature else None
+        mac = hmac.new(WEBHOOK_SECRET_BYTES, digestmod='sha256') if signature_digest else None
+        raw_payload = read_body(request.stream, mac)
 
         # Validate JSON
         try:
-            payload = request.get_json(force=True)
-        except Exception:
+            payload = parse_json(raw_payload)
+        except ValueError:
             logger.warning("Invalid JSON received")
             return jsonify({'error': 'Invalid JSON format'}), 400
 
         # Check for signature header
-        signature = request.headers.get('X-Razorpay-Signature')
         if not signature:
             logger.warning("Missing signature header")
             return jsonify({'error': 'Missing signature header'}), 403
 
         # Verify signature
-        if not verify_signature(raw_payload, signature, app.config['WEBHOOK_SECRET']):
+        if not verify_signature(mac, signature_digest):
             logger.warning("Invalid signature")
             return jsonify({'error': 'Invalid signature'}), 403
 
         # Handle list or single event
-        events = payload if isinstance(payload, list) else [payload]
-
-        results = []
-        for event in events:
-            try:
-                event_type, event_id, payment_id = parse_razorpay_payload(event)
+        is_batch = isinstance(payload, (list, simdjson.Array))
+        events = payload if is_batch else [payload]
 
-                new_event = PaymentEvent(
-                    event_id=event_id,
-                    payment_id=payment_id,
-                    event_type=event_type,
-                    raw_payload=json.dumps(event),
-                    received_at=datetime.utcnow()
-                )
+        # One timestamp for the whole batch
+        received_at = datetime.utcnow()
 
-                db.session.add(new_event)
-                db.session.commit()
+        # Parse and validate everything first, then write in one go
+        rows, row_results, results = build_event_rows(events, raw_payload, is_batch, received_at)
 
-                logger.info(f"Successfully processed event {event_id} for payment {payment_id}")
-                results.append({'event_id': event_id, 'status': 'success'})
-
-            except IntegrityError:
-                db.session.rollback()
-                logger.warning(f"Duplicate event {event.get('id')} ignored")
-                results.append({'event_id': event.get('id'), 'status': 'duplicate'})
-
-            except ValueError as e:
-                logger.error(f"Payload parsing failed for event {event.get('id')}: {e}")
-                results.append({'event_id': event.get('id'), 'status': 'failed', 'error': str(e)})
+        # Write all parsed events in one batch, keeping response order
+        for row, result, status in zip(rows, row_results, store_events(rows)):
+            result['status'] = status
+            if status == 'success':
+                logger.info(f"Successfully processed event {row['event_id']} for payment {row['payment_id']}")
+            else:
+                logger.warning(f"Duplicate event {row['event_id']} ignored")
 
         # Return single event result (for tests expecting a single dict)
         if len(results) == 1:
@@ -155,24 +410,34 @@ def get_payment_events(payment_id):
     Get all events for a specific payment ID, sorted chronologically
     """
     try:
-        events = PaymentEvent.query.filter_by(payment_id=payment_id)\
-                                 .order_by(PaymentEvent.received_at.asc())\
+        # Only load the columns to_dict needs; raw_payload can be large
+        events = PaymentEvent.query.options(load_only(PaymentEvent.event_type, PaymentEvent.received_at))\
+                                 .filter_by(payment_id=payment_id)\
+                                 .order_by(PaymentEvent.received_at.asc(), PaymentEvent.id.asc())\
                                  .all()
         
-        if not events:
-            return jsonify([]), 200
-        
-        return jsonify([event.to_dict() for event in events]), 200
+        body = orjson.dumps([event.to_dict() for event in events])
+        return Response(body, status=200, mimetype='application/json')
         
     except Exception as e:
         logger.error(f"Error fetching events for payment {payment_id}: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+# Health probes get a prebuilt body
+_HEALTH_BODY = orjson.dumps({'status': 'healthy'})
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """
     Health check endpoint
     """
+    return Response(_HEALTH_BODY, status=200, mimetype='application/json')
+
+@app.route('/health/detailed', methods=['GET'])
+def health_check_detailed():
+    """
+    Health check endpoint including the server timestamp
+    """
     return jsonify({'status': 'healthy', 'timestamp': datetime.utcnow().isoformat()}), 200
 
 # Error Handlers
@@ -190,23 +455,22 @@ def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
 # Database initialization
-@app.before_request
 def create_tables():
     """
-    Create database tables before first request
+    Create database tables once at startup
     """
     try:
-        db.create_all()
+        with app.app_context():
+            db.create_all()
         logger.info("Database tables created successfully")
     except Exception as e:
         logger.error(f"Database initialization error: {e}")
 
+# Runs on import so WSGI servers (gunicorn app:app) get the tables too
+create_tables()
+
 if __name__ == '__main__':
-    # Create tables if they don't exist
-    with app.app_context():
-        db.create_all()
-        logger.info("Database initialized")
-    
-    # Run the app
+    # Run the app; the debugger and reloader are opt-in via FLASK_DEBUG=1
     port = int(os.environ.get('PORT', 8000))
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    debug = os.environ.get('FLASK_DEBUG') == '1'
+    app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
\ No newline at end of file
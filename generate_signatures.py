@@ -6,7 +6,8 @@ Script to generate valid HMAC-SHA256 signatures for testing webhook endpoints.
 import hmac
 import hashlib
 import os
-import json
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 
 def generate_signature(payload_file, secret="test_secret"):
     """
@@ -20,12 +21,13 @@ def generate_signature(payload_file, secret="test_secret"):
         str: HMAC-SHA256 signature in hexadecimal format
     """
     try:
-        with open(payload_file, 'r') as f:
+        # Sign the file bytes directly; no decode/re-encode round-trip
+        with open(payload_file, 'rb') as f:
             payload = f.read().strip()
         
         signature = hmac.new(
             secret.encode('utf-8'),
-            payload.encode('utf-8'),
+            payload,
             hashlib.sha256
         ).hexdigest()
         
@@ -52,8 +54,11 @@ def main():
     print(f"Generating signatures using secret: '{secret}'")
     print("-" * 60)
     
-    for payload_file in payload_files:
-        signature = generate_signature(payload_file, secret)
+    # Hash files in parallel; map() keeps results in file order
+    with ProcessPoolExecutor() as executor:
+        signatures = list(executor.map(generate_signature, payload_files, repeat(secret)))
+    
+    for payload_file, signature in zip(payload_files, signatures):
         if signature:
             print(f"File: {payload_file}")
             print(f"Signature: {signature}")